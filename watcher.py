@@ -1,46 +1,136 @@
 import os
-import json
+import signal
 import time
+import ctypes
+import select
+import re
+import queue
+import threading
+from itertools import islice
+from functools import cached_property, lru_cache
+from collections import deque
 import logging
+from logging.handlers import QueueHandler, QueueListener
 import requests
-from collections import deque
-from datetime import datetime
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+import msgspec
+
 logger = logging.getLogger(__name__)
 
+# inotify constants (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_NONBLOCK = os.O_NONBLOCK
+
+
+def inotify_watch(path):
+    """
+    Returns a non-blocking inotify fd watching path for IN_MODIFY,
+    or None if inotify is unavailable on this platform.
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(path), IN_MODIFY) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+class LogEntry(msgspec.Struct):
+    """
+    The subset of Nginx's detailed_json log fields the watcher consumes.
+    """
+    pool: str = ''
+    upstream_status: str = ''
+    request: str = ''
+    status: int = 0
+
+
 class LogWatcher:
     """
     Watches Nginx access logs for failovers and high error rates,
     sending alerts to Slack when thresholds are exceeded.
     """
+    FOOTER = "Blue/Green Monitor"
+    PANE_SIZE = 100  # requests per pane for the longer stats windows
+    ALERT_FLUSH_SEC = 5  # shutdown wait for queued Slack alerts, within docker stop's 10s grace period
+
+    # Beautiful color scheme: (color, title) per alert type, failovers keyed by direction
+    ALERT_STYLES = {
+        'error_rate': ('#DC143C', '🚨 ERROR RATE Alert'),  # Crimson red for errors
+        ('blue', 'green'): ('#FF6B6B', '⚠️ FAILOVER Alert'),  # Coral red - failure detected
+        ('green', 'blue'): ('#4CAF50', '✅ FAILOVER Alert'),  # Green - recovery/healthy
+        'failover': ('#FFA500', '🔄 FAILOVER Alert'),  # Orange - default
+    }
+
     def __init__(self):
         self.slack_webhook = os.getenv('SLACK_WEBHOOK_URL', '')
         self.error_threshold = float(os.getenv('ERROR_RATE_THRESHOLD', '2'))
         self.window_size = int(os.getenv('WINDOW_SIZE', '200'))
         self.cooldown_sec = int(os.getenv('ALERT_COOLDOWN_SEC', '300'))
+        # Longer windows reported in stats, rounded down to whole panes
+        stats_windows = set()
+        for w in os.getenv('STATS_WINDOWS', '1000,5000').split(','):
+            if not w.strip():
+                continue
+            size = max(1, int(w) // self.PANE_SIZE) * self.PANE_SIZE
+            if size != int(w):
+                logger.warning(f"[CONFIG] STATS_WINDOWS value {int(w)} rounded to {size} "
+                               f"(must be a multiple of {self.PANE_SIZE})")
+            stats_windows.add(size)
+        self.stats_windows = sorted(stats_windows)
         self.maintenance_mode = os.getenv('MAINTENANCE_MODE', 'false').lower() == 'true'
         self.log_file = '/var/log/nginx/access.log'
+        self.decoder = msgspec.json.Decoder(LogEntry)
+        # Any 5xx attempt in upstream_status, tolerant of ", " / " : " separators and stray spaces
+        self._5xx_re = re.compile(r'(?:^|[,:\s])5\d\d')
         
         self.last_pool = None
-        self.request_window = deque(maxlen=self.window_size)
-        self.last_failover_alert = 0
-        self.last_error_rate_alert = 0
+        # Sliding window as a W-bit bitmap, newest request in the lowest bit
+        self.window_mask = (1 << self.window_size) - 1
+        self.window_bits = 0
+        self.window_filled = 0
+        self.error_count = 0  # running count of set bits in window_bits
+        self._last_alert = {'failover': 0.0, 'error_rate': 0.0}
+        
+        # Formatted timestamp, cached per wall-clock second
+        self._ts_sec = None
+        self._ts_str = ''
+        
+        # Skip building per-line debug messages unless debug logging is on
+        self._dbg = logger.isEnabledFor(logging.DEBUG)
+        
+        # Per-pane error counts for the stats windows; each window sums its most recent panes
+        max_panes = self.stats_windows[-1] // self.PANE_SIZE if self.stats_windows else 0
+        self.panes = deque(maxlen=max_panes)
+        self.pane_errors = 0
+        self.pane_fill = 0
         
         # Stats for monitoring
         self.total_requests = 0
         self.total_errors = 0
+        self._stats_countdown = 100
+        self._stats_on = logger.isEnabledFor(logging.INFO)
+        
+        # Persistent keep-alive session so alerts reuse the TLS connection to Slack
+        self.http = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        self.http.mount('https://', adapter)
+        
+        # Slack alerts are posted from a background worker
+        self.alert_q = queue.Queue(maxsize=64)
+        self.alert_thread = threading.Thread(target=self._alert_worker, daemon=True)
+        self.alert_thread.start()
         
         logger.info("=" * 70)
         logger.info("[WATCHER] Blue/Green Deployment Monitor - INITIALIZED")
         logger.info("=" * 70)
         logger.info(f"[CONFIG] Error Rate Threshold: {self.error_threshold}%")
         logger.info(f"[CONFIG] Sliding Window Size: {self.window_size} requests")
+        logger.info(f"[CONFIG] Stats Windows: {', '.join(map(str, self.stats_windows)) + ' requests' if self.stats_windows else 'Disabled'}")
         logger.info(f"[CONFIG] Alert Cooldown: {self.cooldown_sec} seconds")
         logger.info(f"[CONFIG] Maintenance Mode: {self.maintenance_mode}")
         logger.info(f"[CONFIG] Slack Webhook: {'✓ Configured' if self.slack_webhook else '✗ Not configured'}")
@@ -51,38 +141,43 @@ class LogWatcher:
         self.send_startup_notification()
         
 
-    def send_startup_notification(self):
+    @cached_property
+    def startup_payload(self):
         """
-        Sends a beautiful startup notification to Slack when the watcher starts.
+        Slack payload for the startup notification, built once on first use.
         """
-        if not self.slack_webhook:
-            logger.info("[STARTUP] Skipping Slack notification (webhook not configured)")
-            return
-        
-        startup_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        slack_payload = {
+        now = time.time()
+        return {
             "attachments": [{
                 "color": "#36A2EB",  # Beautiful blue
                 "title": "🚀 Blue/Green Monitor - Online",
                 "text": "Log watcher has successfully started and is now monitoring your deployment.",
                 "fields": [
                     {"title": "Status", "value": "✅ Active", "short": True},
-                    {"title": "Started At", "value": startup_time, "short": True},
+                    {"title": "Started At", "value": self._ts(now), "short": True},
                     {"title": "Error Threshold", "value": f"{self.error_threshold}%", "short": True},
                     {"title": "Window Size", "value": f"{self.window_size} requests", "short": True},
                     {"title": "Alert Cooldown", "value": f"{self.cooldown_sec}s", "short": True},
                     {"title": "Maintenance Mode", "value": "🔧 Enabled" if self.maintenance_mode else "✓ Disabled", "short": True}
                 ],
-                "footer": "Blue/Green Monitor",
+                "footer": self.FOOTER,
                 "footer_icon": "https://platform.slack-edge.com/img/default_application_icon.png",
-                "ts": int(time.time())
+                "ts": int(now)
             }]
         }
+
+
+    def send_startup_notification(self):
+        """
+        Sends a beautiful startup notification to Slack when the watcher starts.
+        """
+        if not self.slack_webhook:
+            logger.info("[STARTUP] Skipping Slack notification (webhook not configured)")
+            return
         
         try:
             logger.info("[STARTUP] Sending startup notification to Slack...")
-            response = requests.post(self.slack_webhook, json=slack_payload, timeout=5)
+            response = self.http.post(self.slack_webhook, json=self.startup_payload, timeout=5)
             if response.status_code == 200:
                 logger.info("[STARTUP] ✓ Startup notification sent successfully")
             else:
@@ -91,6 +186,30 @@ class LogWatcher:
             logger.error(f"[STARTUP] ✗ Error sending notification: {e}")
 
 
+    def _ts(self, now):
+        """
+        Returns now formatted as 'YYYY-MM-DD HH:MM:SS', reformatting at most once per second.
+        """
+        sec = int(now)
+        if sec != self._ts_sec:
+            self._ts_sec = sec
+            self._ts_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sec))
+        return self._ts_str
+
+
+    @classmethod
+    @lru_cache(maxsize=8)
+    def _alert_style(cls, alert_type, from_pool, to_pool):
+        """
+        Returns the (color, title) for an alert, memoized per (alert_type, from_pool, to_pool).
+        """
+        if alert_type == 'failover':
+            # Different colors based on failover direction
+            return cls.ALERT_STYLES.get((from_pool, to_pool), cls.ALERT_STYLES['failover'])
+        # Blue - info for any other alert type
+        return cls.ALERT_STYLES.get(alert_type) or ('#36A2EB', f"ℹ️ {alert_type.upper().replace('_', ' ')} Alert")
+
+
     def send_slack_alert(self, alert_type, message, details=None, from_pool=None, to_pool=None):
         """
         Sends a formatted alert to Slack.
@@ -106,46 +225,24 @@ class LogWatcher:
             logger.info(f"[MAINTENANCE] Alert suppressed: {alert_type}")
             return
         
-        if alert_type == 'failover':
-            if now - self.last_failover_alert < self.cooldown_sec:
-                logger.info(f"[COOLDOWN] Failover alert suppressed (last alert {int(now - self.last_failover_alert)}s ago)")
-                return
-            self.last_failover_alert = now
-        elif alert_type == 'error_rate':
-            if now - self.last_error_rate_alert < self.cooldown_sec:
-                logger.info(f"[COOLDOWN] Error rate alert suppressed (last alert {int(now - self.last_error_rate_alert)}s ago)")
-                return
-            self.last_error_rate_alert = now
+        last = self._last_alert.get(alert_type, 0.0)
+        if now - last < self.cooldown_sec:
+            logger.info(f"[COOLDOWN] {alert_type} alert suppressed (last alert {int(now - last)}s ago)")
+            return
+        self._last_alert[alert_type] = now
         
-        # Beautiful color scheme
-        if alert_type == 'error_rate':
-            color = '#DC143C'  # Crimson red for errors
-            emoji = '🚨'
-        elif alert_type == 'failover':
-            # Different colors based on failover direction
-            if from_pool == 'blue' and to_pool == 'green':
-                color = '#FF6B6B'  # Coral red - failure detected
-                emoji = '⚠️'
-            elif from_pool == 'green' and to_pool == 'blue':
-                color = '#4CAF50'  # Green - recovery/healthy
-                emoji = '✅'
-            else:
-                color = '#FFA500'  # Orange - default
-                emoji = '🔄'
-        else:
-            color = '#36A2EB'  # Blue - info
-            emoji = 'ℹ️'
+        color, title = self._alert_style(alert_type, from_pool, to_pool)
         
         slack_payload = {
             "attachments": [{
                 "color": color,
-                "title": f"{emoji} {alert_type.upper().replace('_', ' ')} Alert",
+                "title": title,
                 "text": message,
                 "fields": [
-                    {"title": "Timestamp", "value": datetime.now().strftime('%Y-%m-%d %H:%M:%S'), "short": True},
+                    {"title": "Timestamp", "value": self._ts(now), "short": True},
                     {"title": "Alert Type", "value": alert_type, "short": True}
                 ],
-                "footer": "Blue/Green Monitor",
+                "footer": self.FOOTER,
                 "ts": int(now)
             }]
         }
@@ -160,14 +257,10 @@ class LogWatcher:
         
         if self.slack_webhook:
             try:
-                logger.info(f"[SLACK] Sending {alert_type} alert to Slack...")
-                response = requests.post(self.slack_webhook, json=slack_payload, timeout=5)
-                if response.status_code == 200:
-                    logger.info(f"[SLACK] ✓ Alert sent successfully: {alert_type}")
-                else:
-                    logger.error(f"[SLACK] ✗ Error response: {response.status_code} - {response.text}")
-            except Exception as e:
-                logger.error(f"[SLACK] ✗ Failed to send alert: {e}")
+                self.alert_q.put_nowait((alert_type, slack_payload))
+                logger.info(f"[SLACK] Queued {alert_type} alert for delivery")
+            except queue.Full:
+                logger.warning(f"[SLACK] ✗ Alert queue full - dropping {alert_type} alert")
         else:
             logger.warning("[SLACK] ✗ Webhook not configured - alert would be sent:")
             logger.info(f"[ALERT] Type: {alert_type}")
@@ -177,6 +270,54 @@ class LogWatcher:
                     logger.info(f"[ALERT] {key}: {value}")
 
 
+    def _alert_worker(self):
+        """
+        Delivers queued Slack alerts in the background so the log tail never blocks on network I/O.
+        """
+        while True:
+            item = self.alert_q.get()
+            if item is None:
+                # Shutdown sentinel from flush_alerts
+                self.alert_q.task_done()
+                return
+            alert_type, slack_payload = item
+            try:
+                logger.info(f"[SLACK] Sending {alert_type} alert to Slack...")
+                response = self.http.post(self.slack_webhook, json=slack_payload, timeout=5)
+                if response.status_code == 200:
+                    logger.info(f"[SLACK] ✓ Alert sent successfully: {alert_type}")
+                else:
+                    logger.error(f"[SLACK] ✗ Error response: {response.status_code} - {response.text}")
+            except Exception as e:
+                logger.error(f"[SLACK] ✗ Failed to send alert: {e}")
+            finally:
+                self.alert_q.task_done()
+
+
+    def flush_alerts(self, timeout):
+        """
+        Waits up to timeout seconds for queued Slack alerts to be delivered,
+        logging any that are still pending when time runs out.
+        """
+        deadline = time.time() + timeout
+        try:
+            self.alert_q.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.alert_thread.join(max(0.0, deadline - time.time()))
+        if not self.alert_thread.is_alive():
+            return
+        
+        logger.warning("[SLACK] ✗ Alert delivery still in progress at shutdown")
+        while True:
+            try:
+                item = self.alert_q.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                logger.warning(f"[SLACK] ✗ Dropping unsent {item[0]} alert at shutdown")
+
+
     def check_failover(self, pool):
         """
         Checks for failover events and sends alerts.
@@ -207,18 +348,22 @@ class LogWatcher:
         Checks the error rate in the current window and sends alerts if threshold exceeded.
         500-level upstream responses are considered errors.
         """
-        if len(self.request_window) < 20:
+        self._stats_countdown -= 1
+        if self.window_filled < 20:
             return
         
-        error_count = sum(1 for had_error in self.request_window if had_error)
-        total_count = len(self.request_window)
-        error_rate = (error_count / total_count) * 100
+        error_count = self.error_count
+        total_count = self.window_filled
+        error_rate = error_count * 100.0 / total_count
         
         # Log stats periodically (every 100 requests)
-        if self.total_requests % 100 == 0:
-            logger.info(f"[STATS] Total Requests: {self.total_requests} | "
-                       f"Total Errors: {self.total_errors} | "
-                       f"Current Window Error Rate: {error_rate:.2f}%")
+        if self._stats_countdown <= 0:
+            self._stats_countdown = 100
+            if self._stats_on:
+                logger.info("[STATS] Total Requests: %d | Total Errors: %d | "
+                            "Current Window Error Rate: %.2f%%%s",
+                            self.total_requests, self.total_errors, error_rate,
+                            ''.join(f" | Last {size}: {rate:.2f}%" for size, rate in self.window_error_rates()))
         
         if error_rate > self.error_threshold:
             message = f"High error rate: {error_rate:.2f}% (threshold: {self.error_threshold}%)"
@@ -236,6 +381,82 @@ class LogWatcher:
             self.send_slack_alert('error_rate', message, details)
 
 
+    def window_error_rates(self):
+        """
+        Returns (window size, error rate %) for each stats window that is full,
+        summing only the most recent completed panes that window covers.
+        """
+        rates = []
+        for size in self.stats_windows:
+            panes = size // self.PANE_SIZE
+            if panes <= len(self.panes):
+                errors = sum(islice(reversed(self.panes), panes))
+                rates.append((size, errors * 100.0 / size))
+        return rates
+
+
+    def process_lines(self, lines):
+        """
+        Runs the per-line pipeline (decode, 5xx check, window update, alert checks)
+        over a batch of raw log lines.
+        lines: Iterable of bytes-like JSON log lines
+        """
+        # Bind hot attributes to locals for the batch
+        decode = self.decoder.decode
+        find_5xx = self._5xx_re.search
+        window_mask = self.window_mask
+        window_size = self.window_size
+        oldest_shift = window_size - 1
+        pane_size = self.PANE_SIZE
+        panes_append = self.panes.append
+        check_failover = self.check_failover
+        check_error_rate = self.check_error_rate
+        dbg = self._dbg
+        
+        for line in lines:
+            try:
+                log_entry = decode(line)
+                pool = log_entry.pool
+                upstream_status = log_entry.upstream_status
+                request = log_entry.request
+                status = log_entry.status
+            
+                self.total_requests += 1
+            
+                # Check if upstream had any errors (500s)
+                # upstream_status can be like "500, 500, 200" when retries happen
+                had_error = find_5xx(upstream_status) is not None
+            
+                if had_error:
+                    self.total_errors += 1
+                    if dbg:
+                        logger.debug("[ERROR] %s | Status: %s | Upstream: %s | Pool: %s",
+                                     request, status, upstream_status, pool)
+            
+                # Shift the newest request in; the mask drops the oldest, so adjust the count for it
+                bits = self.window_bits
+                self.error_count += had_error - ((bits >> oldest_shift) & 1)
+                self.window_bits = ((bits << 1) | had_error) & window_mask
+                if self.window_filled < window_size:
+                    self.window_filled += 1
+                
+                # Close the current pane once it holds PANE_SIZE requests
+                self.pane_errors += had_error
+                self.pane_fill += 1
+                if self.pane_fill == pane_size:
+                    panes_append(self.pane_errors)
+                    self.pane_errors = 0
+                    self.pane_fill = 0
+            
+                if pool:
+                    check_failover(pool)
+            
+                check_error_rate()
+            except (msgspec.DecodeError, UnicodeDecodeError):
+                # Skip non-JSON lines and lines with invalid UTF-8
+                pass
+
+
     def tail_log(self):
         """
         Tails the Nginx access log and processes new entries.
@@ -248,49 +469,38 @@ class LogWatcher:
         
         logger.info(f"[WATCHER] Log file found. Beginning monitoring...")
         
+        log_fd = os.open(self.log_file, os.O_RDONLY)
+        notify_fd = None
         try:
-            with open(self.log_file, 'r') as f:
-                # Move to end of file
-                f.seek(0, 2)
-                logger.info("[WATCHER] ✓ Ready. Monitoring for failovers and errors...")
-                logger.info("=" * 70)
-                
-                while True:
-                    line = f.readline()
-                    if line:
+            notify_fd = inotify_watch(self.log_file)
+            if notify_fd is None:
+                logger.warning("[WATCHER] inotify unavailable - falling back to polling")
+            
+            # Move to end of file
+            os.lseek(log_fd, 0, os.SEEK_END)
+            logger.info("[WATCHER] ✓ Ready. Monitoring for failovers and errors...")
+            logger.info("=" * 70)
+            
+            pending = bytearray()
+            while True:
+                # Read in large binary chunks and split lines ourselves; the decoder takes bytes
+                chunk = os.read(log_fd, 65536)
+                if chunk:
+                    pending += chunk
+                    *lines, rest = pending.split(b'\n')
+                    pending = rest
+                    self.process_lines(lines)
+                elif notify_fd is not None:
+                    # Block until the kernel reports a write; the timeout is a safety net
+                    ready, _, _ = select.select([notify_fd], [], [], 1.0)
+                    if ready:
                         try:
-                            log_entry = json.loads(line.strip())
-                            pool = log_entry.get('pool', '')
-                            upstream_status = log_entry.get('upstream_status', '')
-                            request = log_entry.get('request', '')
-                            status = log_entry.get('status', 0)
-                            
-                            self.total_requests += 1
-                            
-                            # Check if upstream had any errors (500s)
-                            # upstream_status can be like "500, 500, 200" when retries happen
-                            had_error = False
-                            if upstream_status:
-                                statuses = str(upstream_status).split(', ')
-                                # Check if any upstream attempt was 5xx
-                                had_error = any(s.startswith('5') for s in statuses if s.strip())
-                            
-                            if had_error:
-                                self.total_errors += 1
-                                logger.debug(f"[ERROR] {request} | Status: {status} | "
-                                           f"Upstream: {upstream_status} | Pool: {pool}")
-                            
-                            self.request_window.append(had_error)
-                            
-                            if pool:
-                                self.check_failover(pool)
-                            
-                            self.check_error_rate()
-                        except json.JSONDecodeError:
-                            # Skip non-JSON lines
+                            while os.read(notify_fd, 4096):
+                                pass
+                        except BlockingIOError:
                             pass
-                    else:
-                        time.sleep(0.1)
+                else:
+                    time.sleep(0.1)
         except KeyboardInterrupt:
             logger.info("\n" + "=" * 70)
             logger.info("[WATCHER] Shutting down gracefully...")
@@ -300,10 +510,48 @@ class LogWatcher:
             if self.total_requests > 0:
                 logger.info(f"[STATS]   Overall Error Rate: {(self.total_errors/self.total_requests)*100:.2f}%")
             logger.info("=" * 70)
+            self.flush_alerts(self.ALERT_FLUSH_SEC)
         except Exception as e:
             logger.error(f"[ERROR] Unexpected error: {e}")
             raise
+        finally:
+            os.close(log_fd)
+            if notify_fd is not None:
+                os.close(notify_fd)
+
+def handle_sigterm(signum, frame):
+    """
+    Turns SIGTERM (docker stop) into a graceful shutdown so queued logs are flushed.
+    """
+    raise KeyboardInterrupt
+
+
+def main():
+    """
+    Runs the watcher with log records queued and written to stderr by a background listener.
+    """
+    log_queue = queue.Queue(-1)
+    log_handler = logging.StreamHandler()
+    log_handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    ))
+    log_listener = QueueListener(log_queue, log_handler)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(QueueHandler(log_queue))
+    log_listener.start()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    
+    try:
+        watcher = LogWatcher()
+        watcher.tail_log()
+    except KeyboardInterrupt:
+        # Interrupted before tail_log's own shutdown handling took over
+        logger.info("[WATCHER] Shutting down...")
+    finally:
+        log_listener.stop()
+
 
 if __name__ == '__main__':
-    watcher = LogWatcher()
-    watcher.tail_log()
\ No newline at end of file
+    main()